@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+steam-launch-manager 性能基准
+生成合成的 Steam 用户目录和游戏数据库，测量启动、YAML 加载、参数合并、
+VDF 读写和完整 apply-all 的耗时，并与保存的基线比较
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+# 动态导入 steam-launch-manager 脚本
+script_path = Path(__file__).parent.parent / "src" / "bin" / "steam-launch-manager"
+
+# 进程池按模块名序列化任务函数，同一进程中已注册时直接复用
+steam_launch_manager = sys.modules.get("steam_launch_manager")
+if steam_launch_manager is None:
+    with open(script_path, "r") as f:
+        script_content = f.read()
+
+    steam_launch_manager = type(sys)("steam_launch_manager")
+    sys.modules["steam_launch_manager"] = steam_launch_manager
+    exec(script_content, steam_launch_manager.__dict__)
+
+SteamLaunchManager = steam_launch_manager.SteamLaunchManager
+vdf = steam_launch_manager.vdf
+
+DEFAULT_BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# 合成数据使用的参数池
+ENV_PARAMS = [
+    "DXVK_HUD=fps",
+    "PROTON_USE_WINED3D=1",
+    "RADV_PERFTEST=aco",
+    "MANGOHUD=1",
+    "LD_PRELOAD=/usr/lib/libgamemodeauto.so",
+    'WINEDLLOVERRIDES="dxgi=n,b"',
+]
+WRAPPERS = ["gamemoderun", "mangohud"]
+SUFFIX_PARAMS = ["-novid", "-high", "-console", "-dx11", "-vulkan", "+fps_max 0"]
+
+
+def generate_games(count, seed=0):
+    """生成 count 个简单模式游戏配置"""
+    rng = random.Random(seed)
+    games = {}
+    for index in range(count):
+        app_id = str(10000 + index * 10)
+        game = {"name": f"Synthetic Game {index}"}
+        if rng.random() < 0.8:
+            game["prefix"] = {
+                "params": rng.sample(ENV_PARAMS + WRAPPERS, rng.randint(1, 3)),
+                # merge_keys 每次应用都会重复拼接，合成数据不使用，保证结果可以稳定
+                "conflicts": {"replace_keys": ["DXVK_HUD", "LD_PRELOAD"]},
+            }
+        if rng.random() < 0.7:
+            game["suffix"] = {
+                "params": rng.sample(SUFFIX_PARAMS, rng.randint(1, 2)),
+                "conflicts": {"replace_rules": {"-dx11": "-vulkan"}},
+            }
+        games[app_id] = game
+    return games
+
+
+def random_launch_options(rng):
+    """生成一条用户已有的启动选项"""
+    kind = rng.random()
+    if kind < 0.4:
+        return ""
+    prefix = " ".join(rng.sample(ENV_PARAMS + WRAPPERS, rng.randint(0, 2)))
+    suffix = " ".join(rng.sample(SUFFIX_PARAMS, rng.randint(0, 2)))
+    if kind < 0.9:
+        return f"{prefix} %command% {suffix}".strip()
+    return suffix
+
+
+def generate_localconfig(path, app_ids, binary=False, seed=0):
+    """生成一个 localconfig.vdf，包含 app_ids 中的游戏和一些无关数据"""
+    rng = random.Random(seed)
+    apps = {}
+    for app_id in app_ids:
+        app = {
+            "LastPlayed": str(1700000000 + rng.randint(0, 10**7)),
+            "Playtime": str(rng.randint(0, 5000)),
+            "cloud": {"last_sync_state": "synchronized", "quota_bytes": "1000000"},
+        }
+        options = random_launch_options(rng)
+        if options:
+            app["LaunchOptions"] = options
+        apps[app_id] = app
+
+    data = {
+        "UserLocalConfigStore": {
+            "friends": {
+                str(76561190000000000 + i): {"name": f"friend{i}", "tag": ""}
+                for i in range(200)
+            },
+            "Software": {"Valve": {"Steam": {"apps": apps}}},
+        }
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if binary:
+        path.write_bytes(vdf.binary_dumps(data))
+    else:
+        path.write_text(vdf.dumps(data, pretty=True), encoding="utf-8")
+
+
+class SyntheticTree:
+    """合成的配置目录、Steam 目录和缓存目录"""
+
+    def __init__(self, root, apps, users, games, binary):
+        self.root = Path(root)
+        self.config_dir = self.root / "config"
+        self.steam_dir = self.root / "Steam"
+        self.cache_dir = self.root / "cache"
+        self.apps = apps
+        self.users = users
+        self.games = games
+        self.binary = binary
+
+        game_table = generate_games(games)
+        # 游戏库中一部分是数据库里的游戏，其余是无配置的游戏
+        self.app_ids = list(game_table)[: apps // 2] + [
+            str(900000 + i) for i in range(apps - min(apps // 2, games))
+        ]
+        self.configured_app = next(iter(game_table))
+
+        (self.config_dir / "custom").mkdir(parents=True)
+        (self.config_dir / "community").mkdir(parents=True)
+        custom = {
+            "global": {
+                "steam_dir": str(self.steam_dir),
+                "backup_path": str(self.root / "backups"),
+                "auto_update_community_db": False,
+            },
+            "games": dict(list(game_table.items())[: games // 10]),
+        }
+        community = {"games": dict(list(game_table.items())[games // 10 :])}
+        with open(self.config_dir / "custom" / "games.yaml", "w") as f:
+            steam_launch_manager.yaml_safe_dump(custom, f, sort_keys=False)
+        self.community_path = self.config_dir / "community" / "games.yaml"
+        with open(self.community_path, "w") as f:
+            steam_launch_manager.yaml_safe_dump(community, f, sort_keys=False)
+
+        self.localconfig_paths = [
+            self.steam_dir
+            / "userdata"
+            / str(1000 + user)
+            / "config"
+            / "localconfig.vdf"
+            for user in range(users)
+        ]
+        self.reset_localconfigs()
+
+    def is_binary_user(self, user):
+        if self.binary == "both":
+            return user % 2 == 1
+        return self.binary == "binary"
+
+    def reset_localconfigs(self):
+        """重新生成所有用户的 localconfig.vdf 并清除增量日志"""
+        for user, path in enumerate(self.localconfig_paths):
+            generate_localconfig(
+                path, self.app_ids, binary=self.is_binary_user(user), seed=user
+            )
+        shutil.rmtree(self.cache_dir / "journal", ignore_errors=True)
+
+    def clear_cache(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def create_manager(self, **kwargs):
+        return SteamLaunchManager(config_path=self.config_dir, offline=True, **kwargs)
+
+
+def measure(func, repeat, setup=None):
+    """运行 repeat 次，返回每次的耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def import_command(cli):
+    """只加载模块、不执行 main() 的命令行"""
+    if zipfile.is_zipfile(cli):
+        code = (
+            f"import sys; sys.path.insert(0, {str(cli)!r}); import steam_launch_manager"
+        )
+    else:
+        code = (
+            f"path = {str(cli)!r}; "
+            "exec(compile(open(path).read(), path, 'exec'), {'__name__': 'slm'})"
+        )
+    return [sys.executable, "-c", code]
+
+
+def build_startup_benchmarks(tree, cli):
+    """冷启动基准：每次启动一个新的解释器执行 cli（脚本或 zipapp）"""
+    # HOME 指向临时目录，日志和缓存不写入真实用户目录
+    env = dict(os.environ, HOME=str(tree.root))
+    config = ["--config", str(tree.config_dir), "--offline"]
+
+    def command(argv):
+        def run():
+            subprocess.run(
+                argv,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False,
+            )
+
+        return run
+
+    cli_argv = [sys.executable, str(cli)]
+    return [
+        ("startup_python", command([sys.executable, "-c", "pass"]), None),
+        ("startup_import", command(import_command(cli)), None),
+        ("startup_help", command(cli_argv + ["--help"]), None),
+        ("startup_needs_apply", command(cli_argv + config + ["needs-apply"]), None),
+        ("startup_validate", command(cli_argv + config + ["validate"]), None),
+    ]
+
+
+def import_time_breakdown(cli, limit=15):
+    """用 -X importtime 加载模块，返回累计耗时最长的 [(模块, 微秒)]"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + import_command(cli)[1:],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=False,
+    )
+    modules, children = [], []
+    for line in result.stderr.splitlines():
+        # 格式：import time: self [us] | cumulative | 缩进 + 模块名
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        nested = fields[2][1:2] == " "
+        cumulative = int(fields[1])
+        # 子模块先于父模块输出；zipapp 中的模块本身只是一层外壳，展开它的直接子模块
+        if not nested and name == "steam_launch_manager":
+            modules += children
+        elif not nested:
+            modules.append((name, cumulative))
+        if not nested:
+            children = []
+        elif fields[2][3:4] != " ":
+            children.append((name, cumulative))
+    return sorted(modules, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def build_benchmarks(tree, workers):
+    """返回 [(名称, 函数, 每次运行前的准备函数)]"""
+    sample_path = tree.localconfig_paths[0]
+    binary_path = next(
+        (
+            path
+            for user, path in enumerate(tree.localconfig_paths)
+            if tree.is_binary_user(user)
+        ),
+        None,
+    )
+    community_text = tree.community_path.read_text(encoding="utf-8")
+    rng = random.Random(1)
+    current_options = [random_launch_options(rng) for _ in range(50)]
+
+    def quiet(func):
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+
+        return run
+
+    def constructor_cold():
+        tree.create_manager()
+
+    def constructor_warm():
+        tree.create_manager()
+
+    def yaml_load():
+        steam_launch_manager.yaml_safe_load(community_text)
+
+    def merge():
+        manager = tree.create_manager()
+        steam_launch_manager.tokenize_launch_options.cache_clear()
+        for app_id in list(manager.game_table):
+            game_config, _ = manager.get_game_config(app_id, verbose=False)
+            for options in current_options:
+                manager.calculate_launch_options(options, game_config)
+
+    manager = tree.create_manager()
+    text_data, _ = manager.load_vdf_file(sample_path)
+
+    benchmarks = [
+        ("constructor_cold", constructor_cold, tree.clear_cache),
+        ("constructor_warm", constructor_warm, None),
+        ("yaml_load", yaml_load, None),
+        ("merge", merge, None),
+        ("vdf_parse_text", lambda: manager.load_vdf_file(sample_path), None),
+        ("vdf_dump_text", lambda: vdf.dumps(text_data, pretty=True), None),
+    ]
+    if binary_path is not None:
+        binary_data, _ = manager.load_vdf_file(binary_path)
+        benchmarks += [
+            ("vdf_parse_binary", lambda: manager.load_vdf_file(binary_path), None),
+            ("vdf_dump_binary", lambda: vdf.binary_dumps(binary_data), None),
+        ]
+
+    def apply_all():
+        tree.create_manager(workers=workers).apply_all_configs()
+
+    def diff():
+        tree.create_manager(lazy=True).show_diff(tree.configured_app)
+
+    benchmarks += [
+        ("apply_all_cold", quiet(apply_all), tree.reset_localconfigs),
+        ("apply_all_warm", quiet(apply_all), None),
+        ("diff", quiet(diff), None),
+    ]
+    return benchmarks
+
+
+def run_benchmarks(params, repeat, only=None, cli=script_path):
+    """在临时目录中生成数据并运行所有基准，返回 {名称: {"min", "median"}}"""
+    root = tempfile.mkdtemp(prefix="slm-bench-")
+    original_cache_path = steam_launch_manager.DEFAULT_CACHE_PATH
+    original_racy_seconds = steam_launch_manager.GAME_DB_CACHE_RACY_SECONDS
+    # 合成文件都是刚写入的，不设置时间窗口，否则缓存和增量日志永远不会命中
+    steam_launch_manager.GAME_DB_CACHE_RACY_SECONDS = 0
+    try:
+        tree = SyntheticTree(
+            root,
+            apps=params["apps"],
+            users=params["users"],
+            games=params["games"],
+            binary=params["format"],
+        )
+        steam_launch_manager.DEFAULT_CACHE_PATH = str(tree.cache_dir)
+
+        results = {}
+        benchmarks = build_startup_benchmarks(tree, cli)
+        benchmarks += build_benchmarks(tree, params["workers"])
+        for name, func, setup in benchmarks:
+            if only and name not in only:
+                continue
+            # 先运行一次预热（填充缓存、增量日志等）
+            if setup:
+                setup()
+            func()
+            timings = measure(func, repeat, setup)
+            results[name] = {
+                "min": min(timings),
+                "median": statistics.median(timings),
+            }
+            print(
+                f"  {name:<20} median {results[name]['median'] * 1000:9.2f} ms"
+                f"   min {results[name]['min'] * 1000:9.2f} ms"
+            )
+        return results
+    finally:
+        steam_launch_manager.DEFAULT_CACHE_PATH = original_cache_path
+        steam_launch_manager.GAME_DB_CACHE_RACY_SECONDS = original_racy_seconds
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """按最小耗时与基线比较，返回变慢超过 tolerance 的基准"""
+    regressions = []
+    print("\nComparison with baseline (min):")
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if not reference:
+            print(f"  {name:<20} (no baseline)")
+            continue
+        ratio = result["min"] / reference["min"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  ⚠️  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<20} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark steam-launch-manager on synthetic Steam data"
+    )
+    parser.add_argument("--apps", type=int, default=2000, help="Apps per user")
+    parser.add_argument("--users", type=int, default=4, help="Number of Steam users")
+    parser.add_argument("--games", type=int, default=500, help="Games in the database")
+    parser.add_argument(
+        "--format",
+        choices=["text", "binary", "both"],
+        default="both",
+        help="localconfig.vdf format (both: alternate per user)",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark")
+    parser.add_argument(
+        "--only", action="append", metavar="NAME", help="Only run this benchmark"
+    )
+    parser.add_argument(
+        "--zipapp",
+        type=Path,
+        metavar="PATH",
+        help="Run startup benchmarks against this zipapp instead of the script",
+    )
+    parser.add_argument(
+        "--importtime",
+        action="store_true",
+        help="Print the slowest top-level imports when loading the module",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=DEFAULT_BASELINE_PATH,
+        help="Baseline file to compare with / save to",
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Save results as the baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown before flagging a regression (0.25 = 25%%)",
+    )
+    args = parser.parse_args(argv)
+
+    params = {
+        "apps": args.apps,
+        "users": args.users,
+        "games": args.games,
+        "format": args.format,
+        "workers": args.workers,
+    }
+    cli = args.zipapp or script_path
+    if args.importtime:
+        print(f"Slowest top-level imports for {cli}:")
+        for name, us in import_time_breakdown(cli):
+            print(f"  {name:<40} {us / 1000:9.2f} ms")
+        return 0
+
+    print(
+        f"Benchmarking {args.users} users x {args.apps} apps ({args.format}), "
+        f"{args.games} games, {args.repeat} runs each"
+    )
+    # 基准运行时不输出日志
+    steam_launch_manager.logger.disabled = True
+    try:
+        results = run_benchmarks(params, args.repeat, only=args.only, cli=cli)
+    finally:
+        steam_launch_manager.logger.disabled = False
+
+    if args.save_baseline:
+        baseline = {
+            "params": params,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline first")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("params") != params:
+        print(
+            f"\nBaseline was recorded with different parameters: {baseline['params']}"
+        )
+        return 0
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(
+            f"\n❌ {len(regressions)} benchmark(s) regressed: {', '.join(regressions)}"
+        )
+        return 1
+    print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
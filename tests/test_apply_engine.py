@@ -0,0 +1,1592 @@
+#!/usr/bin/env python3
+"""
+批量应用引擎测试
+直接使用 SteamLaunchManager 核心类，验证 localconfig.vdf 的读写行为
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import vdf
+import yaml
+
+# 动态导入 steam-launch-manager 脚本
+script_path = Path(__file__).parent.parent / "src" / "bin" / "steam-launch-manager"
+
+with open(script_path, "r") as f:
+    script_content = f.read()
+
+steam_launch_manager = type(sys)("steam_launch_manager")
+# 注册模块，进程池需要按模块名序列化任务函数
+sys.modules["steam_launch_manager"] = steam_launch_manager
+exec(script_content, steam_launch_manager.__dict__)
+
+SteamLaunchManager = steam_launch_manager.SteamLaunchManager
+
+
+def write_localconfig(steam_dir, user_id, apps, binary=False):
+    """创建模拟的 localconfig.vdf"""
+    config_dir = os.path.join(steam_dir, "userdata", user_id, "config")
+    os.makedirs(config_dir, exist_ok=True)
+    data = {
+        "UserLocalConfigStore": {
+            "Software": {"Valve": {"Steam": {"apps": apps}}},
+        }
+    }
+    path = os.path.join(config_dir, "localconfig.vdf")
+    if binary:
+        with open(path, "wb") as f:
+            f.write(vdf.binary_dumps(data))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            vdf.dump(data, f, pretty=True)
+    return path
+
+
+def read_launch_options(path):
+    """读取 localconfig.vdf 中所有游戏的启动选项"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw[:1] == b"\x00":
+        data = vdf.binary_loads(raw)
+    else:
+        data = vdf.loads(raw.decode("utf-8"))
+    apps = data["UserLocalConfigStore"]["Software"]["Valve"]["Steam"]["apps"]
+    return {app_id: app.get("LaunchOptions", "") for app_id, app in apps.items()}
+
+
+class ApplyEngineTestCase(unittest.TestCase):
+    """带临时配置目录和 Steam 目录的测试基类"""
+
+    custom_games = {
+        "440": {
+            "name": "Team Fortress 2",
+            "prefix": {"params": ["DXVK_HUD=fps"]},
+            "suffix": {"params": ["-novid"]},
+        },
+    }
+    community_games = {
+        "730": {
+            "name": "Counter-Strike 2",
+            "suffix": {"params": ["-high"]},
+        },
+        "570": {
+            "name": "Dota 2",
+            "suffix": {"params": ["-novid"]},
+        },
+    }
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_dir = os.path.join(self.temp_dir, "steam-launch-manager")
+        self.steam_dir = os.path.join(self.temp_dir, "Steam")
+        self.backup_dir = os.path.join(self.temp_dir, "backups")
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+
+        # 缓存目录指向临时目录，避免污染 ~/.cache
+        self._original_cache_path = steam_launch_manager.DEFAULT_CACHE_PATH
+        steam_launch_manager.DEFAULT_CACHE_PATH = self.cache_dir
+
+        os.makedirs(os.path.join(self.config_dir, "custom"))
+        os.makedirs(os.path.join(self.config_dir, "community"))
+        self.write_custom_config(self.custom_games)
+        with open(os.path.join(self.config_dir, "community", "games.yaml"), "w") as f:
+            yaml.dump({"games": self.community_games}, f)
+
+    def tearDown(self):
+        steam_launch_manager.DEFAULT_CACHE_PATH = self._original_cache_path
+        shutil.rmtree(self.temp_dir)
+
+    def write_custom_config(self, games, **global_options):
+        custom_config = {
+            "global": {
+                "steam_dir": self.steam_dir,
+                "backup_enabled": True,
+                "backup_path": self.backup_dir,
+                "auto_update_community_db": False,
+                **global_options,
+            },
+            "games": games,
+        }
+        with open(os.path.join(self.config_dir, "custom", "games.yaml"), "w") as f:
+            yaml.dump(custom_config, f)
+
+    def create_manager(self, **kwargs):
+        return SteamLaunchManager(config_path=self.config_dir, **kwargs)
+
+
+class TestBatchedApplyAll(ApplyEngineTestCase):
+    """apply-all 每个用户只解析、写入一次 localconfig.vdf"""
+
+    def test_each_localconfig_loaded_and_saved_once(self):
+        paths = [
+            write_localconfig(
+                self.steam_dir, "1001", {"440": {"LaunchOptions": "-console"}}
+            ),
+            write_localconfig(self.steam_dir, "1002", {}, binary=True),
+        ]
+        manager = self.create_manager()
+
+        calls = {"load": 0, "save": 0}
+        original_load = manager.load_vdf_file
+        original_save = manager.save_vdf_file
+
+        def counting_load(*args, **kwargs):
+            calls["load"] += 1
+            return original_load(*args, **kwargs)
+
+        def counting_save(*args, **kwargs):
+            calls["save"] += 1
+            return original_save(*args, **kwargs)
+
+        manager.load_vdf_file = counting_load
+        manager.save_vdf_file = counting_save
+
+        manager.apply_all_configs()
+
+        self.assertEqual(calls, {"load": 2, "save": 2})
+        for path in paths:
+            options = read_launch_options(path)
+            self.assertTrue(options["440"].startswith("DXVK_HUD=fps %command%"))
+            self.assertEqual(options["730"], "%command% -high")
+            self.assertEqual(options["570"], "%command% -novid")
+
+    def test_dry_run_does_not_write(self):
+        path = write_localconfig(self.steam_dir, "1001", {})
+        with open(path, "rb") as f:
+            before = f.read()
+
+        self.create_manager().apply_all_configs(dry_run=True)
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), before)
+
+
+class TestParallelUsers(ApplyEngineTestCase):
+    """多用户并行处理和 --user 过滤"""
+
+    def test_worker_pool_matches_sequential(self):
+        paths = [
+            write_localconfig(
+                self.steam_dir, str(1000 + i), {"440": {"LaunchOptions": "-console"}}
+            )
+            for i in range(4)
+        ]
+        self.create_manager(workers=3).apply_all_configs()
+        parallel = [read_launch_options(path) for path in paths]
+
+        for i in range(4):
+            write_localconfig(
+                self.steam_dir, str(1000 + i), {"440": {"LaunchOptions": "-console"}}
+            )
+        self.create_manager(workers=1).apply_all_configs()
+        sequential = [read_launch_options(path) for path in paths]
+
+        self.assertEqual(parallel, sequential)
+
+    def test_log_listener_is_paused_while_forking(self):
+        paths = [write_localconfig(self.steam_dir, str(1000 + i), {}) for i in range(2)]
+        root = logging.getLogger()
+        self.addCleanup(setattr, root, "handlers", root.handlers[:])
+        self.addCleanup(root.setLevel, root.level)
+        self.addCleanup(steam_launch_manager.shutdown_logging)
+
+        listener_running = []
+        real_fork = os.fork
+
+        def fork():
+            listener = steam_launch_manager._log_listener
+            listener_running.append(listener._thread is not None)
+            return real_fork()
+
+        with mock.patch.dict(os.environ, {"HOME": self.temp_dir}):
+            with contextlib.redirect_stderr(io.StringIO()):
+                steam_launch_manager.setup_logging()
+            with mock.patch.object(os, "fork", fork), contextlib.redirect_stdout(
+                io.StringIO()
+            ):
+                self.create_manager(workers=2).apply_all_configs()
+
+        # 子进程 fork 时后台线程已停止，之后恢复运行
+        self.assertEqual(listener_running, [False, False])
+        self.assertIsNotNone(steam_launch_manager._log_listener._thread)
+        for path in paths:
+            self.assertIn("440", read_launch_options(path))
+
+    def test_user_filter(self):
+        selected = write_localconfig(self.steam_dir, "1001", {})
+        ignored = write_localconfig(self.steam_dir, "1002", {})
+
+        manager = self.create_manager(users=["1001"], workers=2)
+        self.assertEqual(manager.get_localconfig_paths(), [Path(selected)])
+
+        manager.apply_all_configs()
+        self.assertIn("440", read_launch_options(selected))
+        self.assertEqual(read_launch_options(ignored), {})
+
+    def test_extra_steam_roots(self):
+        second_root = os.path.join(self.temp_dir, "Steam2")
+        write_localconfig(self.steam_dir, "1001", {})
+        path = write_localconfig(second_root, "2002", {})
+        self.write_custom_config(self.custom_games, steam_dirs=[second_root])
+
+        self.create_manager().apply_all_configs()
+        self.assertIn("730", read_launch_options(path))
+
+
+class TestGameDatabaseCache(ApplyEngineTestCase):
+    """编译后的游戏数据库缓存"""
+
+    def setUp(self):
+        super().setUp()
+        self.yaml_loads = 0
+        original_safe_load = steam_launch_manager.yaml_safe_load
+
+        def counting_safe_load(stream):
+            self.yaml_loads += 1
+            return original_safe_load(stream)
+
+        steam_launch_manager.yaml_safe_load = counting_safe_load
+        self.addCleanup(
+            setattr, steam_launch_manager, "yaml_safe_load", original_safe_load
+        )
+
+    def age_sources(self):
+        """把源文件 mtime 调到过去，使其超出缓存的时间戳精度保护窗口"""
+        past = os.stat(self.config_dir).st_mtime - 60
+        for name in ("custom", "community"):
+            os.utime(os.path.join(self.config_dir, name, "games.yaml"), (past, past))
+
+    def test_warm_start_skips_yaml(self):
+        self.age_sources()
+        self.create_manager()
+        self.assertEqual(self.yaml_loads, 2)
+
+        manager = self.create_manager()
+        self.assertEqual(self.yaml_loads, 2)
+        game_config, source = manager.get_game_config("730", verbose=False)
+        self.assertEqual(source, "community")
+        self.assertEqual(game_config["name"], "Counter-Strike 2")
+
+    def test_changed_source_rebuilds_cache(self):
+        self.create_manager()
+        self.write_custom_config({"730": {"name": "Custom CS2"}})
+
+        manager = self.create_manager()
+        self.assertEqual(self.yaml_loads, 4)
+        game_config, source = manager.get_game_config("730", verbose=False)
+        self.assertEqual((game_config["name"], source), ("Custom CS2", "custom"))
+
+    def test_touched_but_identical_source_reuses_cache(self):
+        self.create_manager()
+        os.utime(os.path.join(self.config_dir, "custom", "games.yaml"))
+
+        self.create_manager()
+        self.assertEqual(self.yaml_loads, 2)
+
+
+class TestLazyGameDatabase(ApplyEngineTestCase):
+    """延迟解码的游戏数据库"""
+
+    def test_lazy_table_matches_full_parse(self):
+        db_path = Path(__file__).parent.parent / "src" / "data" / "games-db.yaml"
+        text = db_path.read_text(encoding="utf-8")
+        full = yaml.safe_load(text)
+
+        lazy = steam_launch_manager.load_yaml_lazily(text)
+        self.assertEqual(list(lazy["games"]), list(full["games"]))
+        self.assertEqual(dict(lazy["games"]), full["games"])
+        self.assertEqual(lazy["global"], full["global"])
+
+    def test_entries_decoded_on_lookup(self):
+        text = (
+            "games:\n"
+            '  "440":\n'
+            "    name: TF2\n"
+            "    script_template: |\n"
+            "      echo start\n"
+            "\n"
+            "      # kept as script content\n"
+            '  "730":\n'
+            "    name: [unclosed\n"
+        )
+        lazy = steam_launch_manager.load_yaml_lazily(text)
+        # 损坏的 730 条目在被查找之前不会被解析
+        self.assertEqual(
+            lazy["games"]["440"]["script_template"],
+            "echo start\n\n# kept as script content\n",
+        )
+        self.assertIn("730", lazy["games"])
+
+    def test_lazy_manager_lookup(self):
+        manager = self.create_manager(lazy=True)
+        self.assertEqual(manager.get_game_config("440", verbose=False)[1], "custom")
+        self.assertEqual(manager.get_game_config("570", verbose=False)[1], "community")
+        self.assertEqual(manager.get_game_config("999", verbose=False), (None, None))
+
+
+class TestApplyJournal(ApplyEngineTestCase):
+    """增量应用日志：输入未变化的游戏不重新计算"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = write_localconfig(
+            self.steam_dir, "1001", {"440": {"LaunchOptions": "-console"}}
+        )
+
+    def counting_manager(self, **kwargs):
+        manager = self.create_manager(workers=1, **kwargs)
+        self.calls = {"load": 0, "calculate": 0}
+        original_load = manager.load_vdf_file
+        original_calculate = manager.calculate_launch_options
+
+        def counting_load(*args):
+            self.calls["load"] += 1
+            return original_load(*args)
+
+        def counting_calculate(*args):
+            self.calls["calculate"] += 1
+            return original_calculate(*args)
+
+        manager.load_vdf_file = counting_load
+        manager.calculate_launch_options = counting_calculate
+        return manager
+
+    def age_localconfig(self):
+        """把 localconfig.vdf 的 mtime 调到过去，使其超出时间戳精度保护窗口"""
+        past = os.stat(self.path).st_mtime - 60
+        os.utime(self.path, (past, past))
+        journal_path = self.create_manager().apply_journal_path(self.path)
+        with open(journal_path) as f:
+            journal = json.load(f)
+        journal["localconfig"][0] = os.stat(self.path).st_mtime_ns
+        with open(journal_path, "w") as f:
+            json.dump(journal, f)
+
+    def test_unchanged_inputs_are_not_recomputed(self):
+        self.counting_manager().apply_all_configs()
+        self.assertEqual(self.calls["calculate"], 3)
+        applied = read_launch_options(self.path)
+
+        # 刚写入的游戏需要用新的启动选项再确认一次
+        self.counting_manager().apply_all_configs()
+        self.assertEqual(self.calls["calculate"], 3)
+
+        manager = self.counting_manager()
+        manager.apply_all_configs()
+        self.assertEqual(self.calls["calculate"], 0)
+        self.assertEqual(read_launch_options(self.path), applied)
+
+    def test_unchanged_localconfig_is_not_parsed(self):
+        self.create_manager().apply_all_configs()
+        self.create_manager().apply_all_configs()
+        self.age_localconfig()
+
+        self.counting_manager().apply_all_configs()
+        self.assertEqual(self.calls, {"load": 0, "calculate": 0})
+
+    def test_changed_game_config_is_recomputed(self):
+        self.create_manager().apply_all_configs()
+        self.create_manager().apply_all_configs()
+
+        games = dict(self.custom_games)
+        games["440"] = {"name": "Team Fortress 2", "suffix": {"params": ["-dev"]}}
+        self.write_custom_config(games)
+        self.counting_manager().apply_all_configs()
+        self.assertEqual(self.calls["calculate"], 1)
+        self.assertIn("-dev", read_launch_options(self.path)["440"])
+
+    def test_external_edit_is_recomputed(self):
+        self.create_manager().apply_all_configs()
+        self.create_manager().apply_all_configs()
+
+        # Steam 或用户在外部修改了启动选项
+        write_localconfig(self.steam_dir, "1001", {"440": {"LaunchOptions": "-x"}})
+        self.counting_manager().apply_all_configs()
+        self.assertEqual(self.calls["calculate"], 3)
+        self.assertIn("-x", read_launch_options(self.path)["440"])
+
+    def test_partial_apply_does_not_hide_external_edits(self):
+        with mock.patch.object(steam_launch_manager, "GAME_DB_CACHE_RACY_SECONDS", 0):
+            self.create_manager().apply_all_configs()
+            self.create_manager().apply_all_configs()
+
+            # 外部修改了 730，随后只应用 440
+            apps = {
+                app_id: {"LaunchOptions": options}
+                for app_id, options in read_launch_options(self.path).items()
+            }
+            apps["730"]["LaunchOptions"] = "-console"
+            write_localconfig(self.steam_dir, "1001", apps)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.create_manager(workers=1).apply_game_config("440")
+
+            self.create_manager().apply_all_configs()
+        self.assertEqual(
+            read_launch_options(self.path)["730"], "%command% -console -high"
+        )
+
+    def test_tool_upgrade_discards_recorded_results(self):
+        self.create_manager().apply_all_configs()
+        self.create_manager().apply_all_configs()
+
+        with mock.patch.object(
+            steam_launch_manager, "_tool_signature", return_value=[["upgraded"], []]
+        ):
+            self.counting_manager().apply_all_configs()
+        self.assertEqual(self.calls["calculate"], 3)
+
+    def test_full_recomputes_everything(self):
+        self.create_manager().apply_all_configs()
+        self.create_manager().apply_all_configs()
+
+        self.counting_manager().apply_all_configs(full=True)
+        self.assertEqual(self.calls["calculate"], 3)
+
+
+class TestTextVdfPatch(ApplyEngineTestCase):
+    """文本 VDF 只改写变化的启动选项片段"""
+
+    steam_text = (
+        '"UserLocalConfigStore"\n'
+        "{\n"
+        '\t"Software"\n'
+        "\t{\n"
+        '\t\t"Valve"\n'
+        "\t\t{\n"
+        '\t\t\t"Steam"\n'
+        "\t\t\t{\n"
+        '\t\t\t\t"apps"\n'
+        "\t\t\t\t{\n"
+        '\t\t\t\t\t"440"\n'
+        "\t\t\t\t\t{\n"
+        '\t\t\t\t\t\t"LastPlayed"\t\t"1700000000"\n'
+        '\t\t\t\t\t\t"LaunchOptions"\t\t"-console"\n'
+        "\t\t\t\t\t}\n"
+        "\t\t\t\t\t// Steam 不会写注释，但格式应原样保留\n"
+        '\t\t\t\t\t"570"\n'
+        "\t\t\t\t\t{\n"
+        '\t\t\t\t\t\t"Playtime"\t\t"42"\n'
+        "\t\t\t\t\t}\n"
+        "\t\t\t\t}\n"
+        '\t\t\t\t"zLast"\t\t"kept in place"\n'
+        "\t\t\t}\n"
+        "\t\t}\n"
+        "\t}\n"
+        "}\n"
+    )
+
+    def patch(self, text, launch_options):
+        index = steam_launch_manager.TextVdfAppsIndex.build(text)
+        self.assertIsNotNone(index)
+        return index.patch_launch_options(launch_options)
+
+    def test_patch_matches_full_rewrite(self):
+        launch_options = {
+            "440": 'DXVK_HUD=fps %command% -novid "quoted\\path"',
+            "570": "%command% -novid",
+            "730": "line\nbreak\ttab ?'",
+        }
+        patched = self.patch(self.steam_text, launch_options)
+
+        expected = vdf.loads(self.steam_text)
+        apps = expected["UserLocalConfigStore"]["Software"]["Valve"]["Steam"]["apps"]
+        for app_id, options in launch_options.items():
+            apps.setdefault(app_id, {})["LaunchOptions"] = options
+        self.assertEqual(vdf.loads(patched), expected)
+
+        # 未修改的内容保持原样
+        self.assertIn("// Steam 不会写注释", patched)
+        self.assertIn('\t\t\t\t\t\t"LastPlayed"\t\t"1700000000"\n', patched)
+        unchanged_prefix = self.steam_text[: self.steam_text.index('"-console"')]
+        self.assertTrue(patched.startswith(unchanged_prefix))
+
+    def test_crlf_line_endings_preserved(self):
+        text = self.steam_text.replace("\n", "\r\n")
+        patched = self.patch(text, {"570": "-novid", "730": "-high"})
+        self.assertNotIn("\n", patched.replace("\r\n", ""))
+        self.assertEqual(
+            vdf.loads(patched.replace("\r\n", "\n"))["UserLocalConfigStore"][
+                "Software"
+            ]["Valve"]["Steam"]["apps"]["730"],
+            {"LaunchOptions": "-high"},
+        )
+
+    def test_ambiguous_layouts_are_not_indexed(self):
+        duplicate_app = self.steam_text.replace('"570"', '"440"')
+        unquoted = self.steam_text.replace('"Playtime"', "Playtime")
+        for text in (duplicate_app, unquoted, self.steam_text[:-3]):
+            self.assertIsNone(steam_launch_manager.TextVdfAppsIndex.build(text))
+
+    def test_apply_patches_file_in_place(self):
+        path = write_localconfig(self.steam_dir, "1001", {})
+        with open(path, "w") as f:
+            f.write(self.steam_text)
+
+        self.create_manager().apply_all_configs()
+
+        with open(path) as f:
+            text = f.read()
+        self.assertIn("// Steam 不会写注释", text)
+        options = read_launch_options(path)
+        self.assertEqual(options["730"], "%command% -high")
+        self.assertTrue(options["440"].startswith("DXVK_HUD=fps %command%"))
+
+    def test_fallback_to_full_rewrite(self):
+        path = write_localconfig(self.steam_dir, "1001", {})
+        with open(path, "w") as f:
+            f.write(self.steam_text.replace('"570"', '"440"'))
+
+        self.create_manager().apply_all_configs()
+        self.assertEqual(read_launch_options(path)["730"], "%command% -high")
+
+
+class TestFastLaunchOptionsLookup(ApplyEngineTestCase):
+    """diff/dry-run 直接扫描文件读取单个游戏的启动选项"""
+
+    apps = {
+        "440": {
+            "LastPlayed": "1700000000",
+            "cloud": {"LaunchOptions": "nested, not this one"},
+            "LaunchOptions": 'gamemoderun %command% -x "{braces}" C:\\new\n',
+        },
+        "570": {"Playtime": "42"},
+        "730": {"LaunchOptions": "-high"},
+    }
+
+    def scan(self, path, app_id):
+        return steam_launch_manager.scan_launch_options(path, app_id)
+
+    def write(self, text):
+        path = write_localconfig(self.steam_dir, "1001", {})
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_matches_full_parse(self):
+        path = write_localconfig(self.steam_dir, "1001", self.apps)
+        expected = read_launch_options(path)
+        for app_id in ("440", "570", "730", "999"):
+            self.assertEqual(self.scan(path, app_id), expected.get(app_id, ""))
+
+    def test_apps_key_at_wrong_depth_is_skipped(self):
+        data = {
+            "UserLocalConfigStore": {
+                "apps": {"440": {"LaunchOptions": "wrong"}},
+                "Software": {"Valve": {"Steam": {"apps": self.apps}}},
+            }
+        }
+        path = self.write(vdf.dumps(data, pretty=True))
+        self.assertEqual(self.scan(path, "730"), "-high")
+
+    def test_unsure_layouts_return_none(self):
+        duplicate = vdf.dumps(
+            {
+                "UserLocalConfigStore": {
+                    "Software": {"Valve": {"Steam": {"apps": self.apps}}},
+                }
+            },
+            pretty=True,
+        ).replace('"570"', '"730"')
+        unquoted = vdf.dumps(
+            {"UserLocalConfigStore": {"Software": {"Valve": {"Steam": {}}}}}
+        ).replace('"Steam"', "Steam")
+
+        self.assertIsNone(self.scan(self.write(duplicate), "730"))
+        self.assertIsNone(self.scan(self.write(unquoted), "730"))
+        self.assertIsNone(self.scan(self.write(""), "730"))
+        binary = write_localconfig(self.steam_dir, "1002", self.apps, binary=True)
+        self.assertIsNone(self.scan(binary, "730"))
+
+    def test_diff_and_dry_run_do_not_parse_whole_file(self):
+        path = write_localconfig(self.steam_dir, "1001", self.apps)
+        before = read_launch_options(path)
+        manager = self.create_manager(workers=1)
+        manager.load_vdf_file = None  # 任何完整解析都会失败
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertTrue(manager.show_diff("730"))
+            manager.apply_game_config("440", dry_run=True)
+        self.assertIn("Counter-Strike 2", output.getvalue())
+        self.assertEqual(read_launch_options(path), before)
+
+    def test_diff_and_dry_run_do_not_start_worker_pool(self):
+        write_localconfig(self.steam_dir, "1001", self.apps)
+        write_localconfig(self.steam_dir, "1002", self.apps)
+        manager = self.create_manager(workers=4)
+
+        with mock.patch(
+            "concurrent.futures.ProcessPoolExecutor",
+            side_effect=AssertionError("worker pool started"),
+        ), contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(manager.show_diff("730"))
+            manager.apply_game_config("440", dry_run=True)
+
+    def test_fallback_for_binary_files(self):
+        path = write_localconfig(self.steam_dir, "1001", self.apps, binary=True)
+        manager = self.create_manager(workers=1)
+        self.assertEqual(manager.read_launch_options(path, "730"), "-high")
+
+
+class TestVdfFormatDetection(ApplyEngineTestCase):
+    """按文件头判断 VDF 格式，只解析一次"""
+
+    def test_detect_format_from_first_byte(self):
+        detect = steam_launch_manager.detect_vdf_format
+        self.assertEqual(detect(b"\x00UserLocalConfigStore"), "binary")
+        self.assertEqual(detect(b'"UserLocalConfigStore"'), "text")
+        self.assertEqual(detect(b'\n\t"key"'), "text")
+        self.assertEqual(detect("\ufeff".encode("utf-8")), "text")
+        self.assertEqual(detect(b""), "text")
+
+    def test_binary_file_is_not_parsed_as_text(self):
+        path = write_localconfig(self.steam_dir, "1001", {}, binary=True)
+        manager = self.create_manager()
+        with mock.patch.object(
+            steam_launch_manager.vdf, "load", side_effect=AssertionError
+        ):
+            data, vdf_format = manager.load_vdf_file(path)
+        self.assertEqual(vdf_format, "binary")
+        self.assertIn("UserLocalConfigStore", data)
+
+    def test_format_cached_until_file_changes(self):
+        path = write_localconfig(self.steam_dir, "1001", {})
+        manager = self.create_manager()
+        self.assertEqual(manager.vdf_file_format(path), "text")
+
+        with mock.patch("builtins.open", side_effect=AssertionError):
+            self.assertEqual(manager.vdf_file_format(path), "text")
+
+        write_localconfig(self.steam_dir, "1001", {"440": {}}, binary=True)
+        self.assertEqual(manager.vdf_file_format(path), "binary")
+
+    def test_error_names_detected_format(self):
+        path = write_localconfig(self.steam_dir, "1001", {})
+        with open(path, "wb") as f:
+            f.write(b'"UserLocalConfigStore"\n{\n\xff\xfe')
+
+        with self.assertRaisesRegex(Exception, "detected text format"):
+            self.create_manager().load_vdf_file(path)
+
+
+class TestAtomicWrites(ApplyEngineTestCase):
+    """localconfig.vdf 原子写入"""
+
+    def test_mode_preserved_and_one_fsync_per_user(self):
+        paths = [
+            write_localconfig(self.steam_dir, user_id, {})
+            for user_id in ("1001", "1002")
+        ]
+        for path in paths:
+            os.chmod(path, 0o640)
+        # 只统计 localconfig.vdf 的写入
+        self.write_custom_config(self.custom_games, backup_enabled=False)
+
+        with mock.patch.object(
+            steam_launch_manager.os, "fsync", wraps=os.fsync
+        ) as fsync:
+            self.create_manager(workers=1).apply_all_configs()
+
+        self.assertEqual(fsync.call_count, len(paths))
+        for path in paths:
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+            self.assertIn("730", read_launch_options(path))
+
+    def test_failed_write_keeps_original(self):
+        path = write_localconfig(self.steam_dir, "1001", {"440": {}})
+        with open(path, "rb") as f:
+            before = f.read()
+
+        with mock.patch.object(
+            steam_launch_manager.os, "fsync", side_effect=OSError("disk full")
+        ):
+            with self.assertRaises(OSError):
+                steam_launch_manager.write_file_atomically(path, b"truncated")
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["localconfig.vdf"])
+
+    def test_symlink_target_is_written(self):
+        target = write_localconfig(self.steam_dir, "1001", {})
+        link = os.path.join(self.temp_dir, "link.vdf")
+        os.symlink(target, link)
+
+        steam_launch_manager.write_file_atomically(link, b"new")
+        self.assertTrue(os.path.islink(link))
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), b"new")
+
+
+class TestBackupStore(ApplyEngineTestCase):
+    """按内容寻址、去重的备份存储"""
+
+    def apply(self, user_apps, **kwargs):
+        for user_id, apps in user_apps.items():
+            write_localconfig(self.steam_dir, user_id, apps)
+        manager = self.create_manager(workers=1, **kwargs)
+        manager.apply_all_configs(full=True)
+        return manager
+
+    def object_files(self):
+        return sorted(Path(self.backup_dir, "objects").glob("*/*.gz"))
+
+    def test_one_record_per_user_per_run(self):
+        manager = self.apply(
+            {
+                "1001": {"440": {"LaunchOptions": "-console"}},
+                "1002": {"730": {"LaunchOptions": "-low"}},
+            }
+        )
+        runs = manager.backup_store.runs()
+        self.assertEqual(len(runs), 1)
+        records = {r["user"]: r for r in runs[0]["records"]}
+        self.assertEqual(records["1001"]["apps"], ["440", "570", "730"])
+
+        record = manager.backup_store.load(records["1002"]["object"])
+        self.assertEqual(record["apps"]["730"], "-low")
+        self.assertEqual(record["apps"]["440"], "")
+        self.assertEqual(len(self.object_files()), 2)
+        self.assertEqual(os.listdir(self.backup_dir), ["objects", "runs"])
+
+    def test_identical_backups_are_deduplicated(self):
+        self.apply({"1001": {"440": {"LaunchOptions": "-console"}}})
+        manager = self.apply({"1001": {"440": {"LaunchOptions": "-console"}}})
+
+        self.assertEqual(len(manager.backup_store.runs()), 2)
+        self.assertEqual(len(self.object_files()), 1)
+
+    def test_no_backup_without_changes(self):
+        self.apply({"1001": {}})
+        manager = self.create_manager(workers=1)
+        manager.apply_all_configs(full=True)
+        self.assertEqual(len(manager.backup_store.runs()), 1)
+
+    def test_prune_by_run_count(self):
+        self.write_custom_config(self.custom_games, backup_keep_runs=2)
+        for i in range(4):
+            manager = self.apply({"1001": {"440": {"LaunchOptions": f"-run{i}"}}})
+
+        runs = manager.backup_store.runs()
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(
+            manager.backup_store.load(runs[-1]["records"][0]["object"])["apps"]["440"],
+            "-run3",
+        )
+        # 被删除运行的记录超出保护期后才会被清理
+        past = time.time() - steam_launch_manager.BACKUP_GC_GRACE_SECONDS - 60
+        for path in self.object_files():
+            os.utime(path, (past, past))
+        manager.prune_backups()
+        self.assertEqual(len(self.object_files()), 2)
+
+    def test_prune_legacy_backup_files(self):
+        # 旧版本每个游戏一个文件，同一时间戳的文件属于同一次运行
+        os.makedirs(self.backup_dir)
+        legacy = [
+            "app_440_20240101_100000.txt",
+            "app_730_20240101_100000.txt",
+            "app_440_20240102_100000.txt",
+            "app_example_game_20240103_100000.txt",
+        ]
+        for name in legacy + ["notes.txt"]:
+            with open(os.path.join(self.backup_dir, name), "w") as f:
+                f.write("# Original launch options:\n-console")
+
+        self.write_custom_config(self.custom_games, backup_keep_runs=2)
+        self.apply({"1001": {"440": {"LaunchOptions": "-console"}}})
+        remaining = set(os.listdir(self.backup_dir))
+        self.assertEqual(remaining, {"objects", "runs", "notes.txt", legacy[3]})
+
+        # 总大小限制同样计入旧格式的备份
+        self.write_custom_config(self.custom_games, backup_max_size_mb=0.000001)
+        self.apply({"1001": {"440": {"LaunchOptions": "-novid"}}})
+        self.assertNotIn(legacy[3], os.listdir(self.backup_dir))
+
+    def test_prune_by_size_keeps_latest_run(self):
+        self.write_custom_config(self.custom_games, backup_max_size_mb=0.000001)
+        for i in range(3):
+            manager = self.apply({"1001": {"440": {"LaunchOptions": f"-run{i}"}}})
+        runs = manager.backup_store.runs()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(
+            manager.backup_store.load(runs[0]["records"][0]["object"])["apps"]["440"],
+            "-run2",
+        )
+
+
+class TestRollback(ApplyEngineTestCase):
+    """从备份批量恢复启动选项"""
+
+    def setUp(self):
+        super().setUp()
+        self.paths = {
+            "1001": write_localconfig(
+                self.steam_dir, "1001", {"440": {"LaunchOptions": "-console"}}
+            ),
+            "1002": write_localconfig(
+                self.steam_dir, "1002", {"730": {"LaunchOptions": "-low"}}
+            ),
+        }
+        self.originals = {
+            user_id: read_launch_options(path) for user_id, path in self.paths.items()
+        }
+        self.create_manager(workers=1).apply_all_configs()
+
+    def rollback(self, *args, **kwargs):
+        manager = self.create_manager(workers=1)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result = manager.rollback(*args, **kwargs)
+        return manager, result, output.getvalue()
+
+    def test_restore_whole_run_with_one_write_per_user(self):
+        manager = self.create_manager(workers=1)
+        run_id = manager.backup_store.runs()[-1]["run"]
+        saves = []
+        original_save = manager.save_vdf_file
+        manager.save_vdf_file = lambda *args: saves.append(args[0]) or original_save(
+            *args
+        )
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(manager.rollback(run_id=run_id))
+
+        self.assertEqual(len(saves), 2)
+        self.assertEqual(read_launch_options(self.paths["1001"])["440"], "-console")
+        self.assertEqual(read_launch_options(self.paths["1002"])["730"], "-low")
+        self.assertEqual(read_launch_options(self.paths["1002"])["570"], "")
+
+    def test_restore_selected_apps_from_latest_backup(self):
+        _, result, _ = self.rollback(["440"])
+        self.assertTrue(result)
+        options = read_launch_options(self.paths["1001"])
+        self.assertEqual(options["440"], "-console")
+        self.assertEqual(options["730"], "%command% -high")
+
+    def test_user_filter(self):
+        manager = self.create_manager(workers=1, users=["1002"])
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.rollback(["440", "730"])
+        self.assertEqual(read_launch_options(self.paths["1002"])["730"], "-low")
+        self.assertNotEqual(read_launch_options(self.paths["1001"])["440"], "-console")
+
+    def test_dry_run_does_not_write(self):
+        before = read_launch_options(self.paths["1001"])
+        _, _, output = self.rollback(["440"], dry_run=True)
+        self.assertIn("-console", output)
+        self.assertEqual(read_launch_options(self.paths["1001"]), before)
+
+    def test_rollback_is_backed_up(self):
+        self.rollback(["440"])
+        _, _, output = self.rollback(["440"])
+        # 最近一次备份是回滚前的值，再次回滚恢复已应用的配置
+        self.assertIn("DXVK_HUD=fps", read_launch_options(self.paths["1001"])["440"])
+        self.assertIn("2 launch options restored", output)
+
+    def test_unknown_run_and_listing(self):
+        _, result, output = self.rollback(run_id="19700101-000000")
+        self.assertFalse(result)
+        self.assertIn("not found", output)
+
+        _, result, output = self.rollback()
+        self.assertFalse(result)
+        self.assertIn("2 user(s), 6 app(s)", output)
+
+        # 命令行：找不到备份时退出码非零，只列出备份时成功
+        cmd = [sys.executable, str(script_path), "--config", self.config_dir]
+        env = dict(os.environ, HOME=self.temp_dir)
+        result = subprocess.run(
+            cmd + ["rollback", "--run", "19700101-000000"],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("not found", result.stdout)
+        result = subprocess.run(
+            cmd + ["rollback"], capture_output=True, text=True, env=env
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("2 user(s), 6 app(s)", result.stdout)
+
+
+class TestMergePlan(ApplyEngineTestCase):
+    """预编译的合并计划"""
+
+    game_config = {
+        "prefix": {
+            "params": ["DXVK_HUD=fps", "LD_PRELOAD=/managed.so", "gamemoderun"],
+            "conflicts": {
+                "replace_keys": ["DXVK_HUD"],
+                "merge_keys": {"LD_PRELOAD": "prepend"},
+            },
+        },
+        "suffix": {
+            "params": ["-novid"],
+            "conflicts": {"replace_rules": {"-dx11": "-vulkan", "-windowed": ""}},
+        },
+    }
+
+    def test_plan_matches_merge_methods(self):
+        manager = self.create_manager()
+        current = "DXVK_HUD=full LD_PRELOAD=/user.so %COMMAND% -dx11 -windowed"
+        user_prefix, user_suffix = manager.parse_current_params(current)
+        prefix, suffix = self.game_config["prefix"], self.game_config["suffix"]
+
+        expected_prefix = manager.merge_prefix_params(
+            user_prefix, prefix, {}, prefix["conflicts"]
+        )
+        expected_suffix = manager.merge_suffix_params(
+            user_suffix, suffix, {}, suffix["conflicts"]
+        )
+        self.assertEqual(
+            manager.calculate_launch_options(current, self.game_config),
+            f"{' '.join(expected_prefix)} %command% {expected_suffix}",
+        )
+        self.assertEqual(
+            expected_prefix,
+            ["DXVK_HUD=fps", "LD_PRELOAD=/managed.so:/user.so", "gamemoderun"],
+        )
+        self.assertEqual(expected_suffix, "-vulkan -novid")
+
+    def test_empty_replacement_keeps_option_value(self):
+        manager = self.create_manager()
+        game_config = {"suffix": {"conflicts": {"replace_rules": {"-fullscreen": ""}}}}
+        self.assertEqual(
+            manager.calculate_launch_options(
+                "%command% -fullscreen game.ini", game_config
+            ),
+            "%command% game.ini",
+        )
+        self.assertEqual(
+            manager.calculate_launch_options(
+                "%command% -fullscreen -novid", game_config
+            ),
+            "%command% -novid",
+        )
+
+    def test_plan_compiled_once_per_game(self):
+        manager = self.create_manager()
+        plan = manager.get_merge_plan(self.game_config)
+        self.assertIs(manager.get_merge_plan(self.game_config), plan)
+        self.assertFalse(hasattr(plan, "__dict__"))
+        self.assertIsNot(manager.get_merge_plan(dict(self.game_config)), plan)
+
+
+class TestLaunchOptionTokenizer(ApplyEngineTestCase):
+    """识别引号和选项值的启动选项解析"""
+
+    def test_structured_tokens(self):
+        tokens = steam_launch_manager.tokenize_launch_options(
+            'WINEDLLOVERRIDES="a, b=n" gamemoderun %COMMAND% -w 1280 +fps_max 0 -novid'
+        )
+        self.assertEqual(tokens.env, ('WINEDLLOVERRIDES="a, b=n"',))
+        self.assertEqual(tokens.wrappers, ("gamemoderun",))
+        self.assertEqual(tokens.command, "%COMMAND%")
+        self.assertEqual(tokens.args, ("-w 1280", "+fps_max 0", "-novid"))
+
+        tokens = steam_launch_manager.tokenize_launch_options("-novid -high")
+        self.assertIsNone(tokens.command)
+        self.assertEqual(tokens.args, ("-novid", "-high"))
+
+    def test_quoted_env_and_option_values_survive_merge(self):
+        manager = self.create_manager()
+        game_config = {
+            "prefix": {"params": ["DXVK_HUD=fps"]},
+            "suffix": {
+                "params": ["+fps_max 0"],
+                "conflicts": {"replace_rules": {"-w": "-width"}},
+            },
+        }
+        self.assertEqual(
+            manager.calculate_launch_options(
+                'WINEDLLOVERRIDES="a, b=n" %command% +fps_max 0 +cl_x 0 -w 1280',
+                game_config,
+            ),
+            'WINEDLLOVERRIDES="a, b=n" DXVK_HUD=fps %command% '
+            "+fps_max 0 +cl_x 0 -width 1280",
+        )
+
+    def test_each_string_parsed_once(self):
+        manager = self.create_manager()
+        tokenize = steam_launch_manager.tokenize_launch_options
+        options = "LD_PRELOAD=/unique.so %command% -unique-option"
+        tokenize.cache_clear()
+        for _ in range(3):
+            manager.parse_current_params(options)
+            manager.are_configs_equivalent(options, options + " -x")
+        self.assertEqual(tokenize.cache_info().misses, 2)
+
+
+class TestPhaseProfiler(ApplyEngineTestCase):
+    """--profile 的阶段统计"""
+
+    def setUp(self):
+        super().setUp()
+        self.profiler = steam_launch_manager.profiler
+        self.profiler.take()
+        self.profiler.enable()
+
+    def tearDown(self):
+        self.profiler.enabled = False
+        self.profiler.take()
+        super().tearDown()
+
+    def test_disabled_profiler_records_nothing(self):
+        profiler = steam_launch_manager.PhaseProfiler()
+        with profiler.phase("noop"):
+            pass
+        self.assertEqual(profiler.stats, {})
+
+    def test_phases_and_user_directories_are_recorded(self):
+        for user_id in ("1001", "1002"):
+            write_localconfig(self.steam_dir, user_id, {})
+        self.create_manager(workers=1).apply_all_configs()
+
+        stats = self.profiler.stats
+        self.assertEqual(stats[("load_configs", None)][0], 1)
+        self.assertEqual(stats[("load_vdf_file", None)][0], 2)
+        self.assertEqual(stats[("save_vdf_file", None)][0], 2)
+        self.assertEqual(stats[("calculate_launch_options", None)][0], 6)
+        self.assertEqual(stats[("user", "1001")][0], 1)
+        self.assertEqual(stats[("user", "1002")][0], 1)
+
+    def test_worker_statistics_are_merged(self):
+        for i in range(3):
+            write_localconfig(self.steam_dir, str(1000 + i), {})
+        self.create_manager(workers=3).apply_all_configs()
+
+        stats = self.profiler.stats
+        self.assertEqual(stats[("load_vdf_file", None)][0], 3)
+        for i in range(3):
+            self.assertIn(("user", str(1000 + i)), stats)
+
+    def test_json_report(self):
+        with self.profiler.phase("outer"):
+            with self.profiler.phase("inner", scope="1001"):
+                pass
+        path = os.path.join(self.temp_dir, "profile.json")
+        self.profiler.write_json(path)
+
+        with open(path) as f:
+            phases = json.load(f)["phases"]
+        self.assertEqual(phases[0]["phase"], "outer")
+        self.assertEqual(
+            {key: phases[1][key] for key in ("phase", "scope", "calls")},
+            {"phase": "inner", "scope": "1001", "calls": 1},
+        )
+
+
+class TestRunMetrics(ApplyEngineTestCase):
+    """运行指标：游戏/用户统计、Prometheus textfile 和 NDJSON 输出"""
+
+    def test_failed_user_does_not_stop_other_users(self):
+        good = write_localconfig(self.steam_dir, "1001", {})
+        broken = write_localconfig(self.steam_dir, "1002", {})
+        with open(broken, "w") as f:
+            f.write('"UserLocalConfigStore"\n{\n  "unclosed"\n')
+
+        manager = self.create_manager(workers=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(manager.apply_all_configs())
+
+        self.assertIn("440", read_launch_options(good))
+        self.assertEqual(manager.run_metrics["users"], {"processed": 1, "failed": 1})
+        self.assertEqual(
+            manager.run_metrics["apps"],
+            {"evaluated": 3, "changed": 3, "skipped": 0, "failed": 0},
+        )
+
+    def test_run_record_and_outputs(self):
+        write_localconfig(self.steam_dir, "1001", {"440": {"LaunchOptions": "-novid"}})
+        manager = self.create_manager(workers=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.apply_all_configs()
+        record = manager.build_run_record("apply-all", 0.5, True)
+
+        self.assertEqual(
+            record["apps"], {"evaluated": 3, "changed": 3, "skipped": 0, "failed": 0}
+        )
+        self.assertEqual(record["users"], {"processed": 1, "failed": 0})
+
+        textfile = Path(self.temp_dir) / "metrics" / "slm.prom"
+        ndjson = Path(self.temp_dir) / "metrics.ndjson"
+        manager.write_run_metrics(record, textfile, ndjson)
+        manager.write_run_metrics(record, None, ndjson)
+
+        prometheus = textfile.read_text()
+        self.assertIn(
+            'steam_launch_manager_apps{command="apply-all",state="changed"} 3',
+            prometheus,
+        )
+        self.assertIn(
+            'steam_launch_manager_last_run_success{command="apply-all"} 1', prometheus
+        )
+        lines = ndjson.read_text().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["apps"]["changed"], 3)
+
+        # node_exporter 通常以其他用户运行，新文件需要可读
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(textfile.stat().st_mode & 0o777, 0o666 & ~umask)
+
+        # 其他命令不覆盖 apply-all 的 textfile，只追加 NDJSON
+        manager.write_run_metrics(
+            manager.build_run_record("diff", 0.1, True), textfile, ndjson
+        )
+        self.assertEqual(textfile.read_text(), prometheus)
+        self.assertEqual(len(ndjson.read_text().splitlines()), 3)
+
+    def test_prometheus_label_escaping(self):
+        record = {
+            "command": "apply",
+            "timestamp": 0,
+            "success": False,
+            "duration_seconds": 0,
+            "phases": {},
+            "apps": {},
+            "users": {},
+            "network_wait_seconds": 0,
+            "db_version": 'v"1\\2',
+            "db_source": None,
+        }
+        text = steam_launch_manager.format_prometheus_metrics(record)
+        self.assertIn('version="v\\"1\\\\2",source=""', text)
+
+    def test_metrics_targets_from_config(self):
+        self.write_custom_config(
+            self.custom_games, metrics={"ndjson": "~/slm-metrics.ndjson"}
+        )
+        manager = self.create_manager()
+        textfile, ndjson = manager.metrics_targets()
+        self.assertIsNone(textfile)
+        self.assertEqual(ndjson, Path("~/slm-metrics.ndjson").expanduser())
+
+        textfile, _ = manager.metrics_targets(textfile="/tmp/override.prom")
+        self.assertEqual(textfile, Path("/tmp/override.prom"))
+
+
+class TestWatchMode(ApplyEngineTestCase):
+    """watch 模式：文件监视和只重新应用受影响的游戏"""
+
+    def replace_file(self, path, content):
+        """模拟 Steam 通过重命名替换文件"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def check_watcher(self, watcher):
+        watched = Path(self.temp_dir) / "watched" / "games.yaml"
+        watched.parent.mkdir()
+        watched.write_text("a")
+        new_dirs = Path(self.temp_dir) / "userdata"
+        new_dirs.mkdir()
+        self.addCleanup(watcher.close)
+        watcher.set_paths([watched], [new_dirs])
+
+        (watched.parent / "unrelated.txt").write_text("x")
+        self.assertEqual(watcher.wait(0.3), set())
+
+        self.replace_file(watched, "bb")
+        self.assertEqual(watcher.wait(5), {watched})
+
+        (new_dirs / "1001").mkdir()
+        self.assertEqual(watcher.wait(5), {new_dirs})
+        self.assertEqual(watcher.wait(0.1), set())
+
+    def test_inotify_watcher(self):
+        try:
+            watcher = steam_launch_manager.InotifyWatcher()
+        except OSError as e:
+            self.skipTest(f"inotify unavailable: {e}")
+        self.check_watcher(watcher)
+
+    def test_polling_watcher(self):
+        self.check_watcher(steam_launch_manager.PollingWatcher(interval=0.05))
+
+    def apply_changes(self, manager, state, changed):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return manager.handle_watch_changes(changed, state)
+
+    def test_config_change_reapplies_only_affected_games(self):
+        path = Path(write_localconfig(self.steam_dir, "1001", {}))
+        manager = self.create_manager(workers=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.apply_all_configs()
+        state = manager.new_watch_state()
+
+        games = {"440": {"suffix": {"params": ["-novid", "-console"]}}}
+        self.write_custom_config(games)
+        with mock.patch.object(
+            manager, "calculate_launch_options", wraps=manager.calculate_launch_options
+        ) as calculate:
+            changed = self.apply_changes(manager, state, {manager.custom_config_path})
+
+        self.assertEqual(changed, {"440"})
+        # 只有配置变化的游戏被重新计算
+        self.assertEqual(calculate.call_count, 1)
+        self.assertIn("-console", read_launch_options(path)["440"])
+
+    def test_merge_plans_do_not_accumulate_across_reloads(self):
+        write_localconfig(self.steam_dir, "1001", {})
+        manager = self.create_manager(workers=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.apply_all_configs()
+        state = manager.new_watch_state()
+        plan_count = len(manager._merge_plans)
+        self.assertGreater(plan_count, 0)
+
+        for index in range(5):
+            games = {"440": {"suffix": {"params": ["-novid", f"-x{index}"]}}}
+            self.write_custom_config(games)
+            changed = self.apply_changes(manager, state, {manager.custom_config_path})
+            self.assertEqual(changed, {"440"})
+        # 只保留当前配置表中条目的合并计划
+        self.assertLessEqual(len(manager._merge_plans), plan_count)
+
+    def test_invalid_config_keeps_previous_games(self):
+        path = Path(write_localconfig(self.steam_dir, "1001", {}))
+        manager = self.create_manager(workers=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.apply_all_configs()
+        state = manager.new_watch_state()
+        game_table = manager.game_table
+
+        # 编辑器保存了一半的文件不会让 watch 退出
+        with open(manager.custom_config_path, "w") as f:
+            f.write("games: [unclosed\n")
+        with self.assertLogs(steam_launch_manager.logger, "ERROR"):
+            changed = self.apply_changes(manager, state, {manager.custom_config_path})
+        self.assertEqual(changed, set())
+        self.assertIs(manager.game_table, game_table)
+
+        self.write_custom_config({"440": {"suffix": {"params": ["-console"]}}})
+        changed = self.apply_changes(manager, state, {manager.custom_config_path})
+        self.assertEqual(changed, {"440"})
+        self.assertIn("-console", read_launch_options(path)["440"])
+
+        # 本工具写入 localconfig.vdf 产生的事件被忽略
+        self.assertEqual(self.apply_changes(manager, state, {path}), set())
+
+    def test_external_localconfig_change_is_reapplied(self):
+        path = Path(write_localconfig(self.steam_dir, "1001", {}))
+        other = Path(write_localconfig(self.steam_dir, "1002", {}))
+        manager = self.create_manager(workers=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.apply_all_configs()
+        state = manager.new_watch_state()
+        other_before = other.read_bytes()
+
+        # Steam 退出时用自己的内存状态覆盖了启动选项
+        write_localconfig(self.steam_dir, "1001", {"440": {"LaunchOptions": "-x"}})
+        changed = self.apply_changes(manager, state, {path})
+
+        self.assertEqual(changed, {"440", "570", "730"})
+        self.assertIn("DXVK_HUD=fps", read_launch_options(path)["440"])
+        self.assertEqual(other.read_bytes(), other_before)
+
+    def test_new_user_is_discovered(self):
+        write_localconfig(self.steam_dir, "1001", {})
+        manager = self.create_manager(workers=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.apply_all_configs()
+        state = manager.new_watch_state()
+
+        new_path = Path(write_localconfig(self.steam_dir, "1002", {}))
+        userdata = Path(self.steam_dir) / "userdata"
+        self.apply_changes(manager, state, {userdata})
+
+        self.assertIn(new_path, state["paths"])
+        self.assertIn("440", read_launch_options(new_path))
+
+
+class TestNeedsApply(ApplyEngineTestCase):
+    """needs-apply：比较上次 apply-all 记录的输入指纹"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = write_localconfig(self.steam_dir, "1001", {})
+
+    def apply_all(self, **kwargs):
+        manager = self.create_manager(workers=1, offline=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.apply_all_configs(**kwargs)
+
+    def needs_apply(self, users=None):
+        return steam_launch_manager.needs_apply(self.config_dir, users)
+
+    def test_up_to_date_after_apply_all(self):
+        self.assertEqual(self.needs_apply(), "no previous apply recorded")
+        self.apply_all(dry_run=True)
+        self.assertIsNotNone(self.needs_apply())
+
+        self.apply_all()
+        self.assertIsNone(self.needs_apply())
+
+    def test_changed_inputs_are_detected(self):
+        self.apply_all()
+
+        # 只修改时间戳不需要重新应用
+        os.utime(self.path)
+        self.assertIsNone(self.needs_apply())
+
+        write_localconfig(self.steam_dir, "1001", {"440": {"LaunchOptions": "-x"}})
+        self.assertIn("localconfig.vdf changed", self.needs_apply())
+
+        self.apply_all()
+        self.write_custom_config({"440": {"suffix": {"params": ["-console"]}}})
+        self.assertIn("games.yaml changed", self.needs_apply())
+
+    def test_new_user_and_user_selection(self):
+        self.apply_all()
+        self.assertEqual(
+            self.needs_apply(users=["1001"]), "different Steam users selected"
+        )
+
+        write_localconfig(self.steam_dir, "1002", {})
+        self.assertEqual(self.needs_apply(), "Steam users changed")
+
+    def test_due_update_check_does_not_require_apply(self):
+        self.write_custom_config(self.custom_games, auto_update_community_db=True)
+        self.apply_all()
+        # 版本文件很久没有更新（例如没有网络的机器）也不强制 apply-all
+        version_path = os.path.join(self.config_dir, "community", "version.txt")
+        if os.path.exists(version_path):
+            os.utime(version_path, (0, 0))
+        self.assertIsNone(self.needs_apply())
+
+
+class TestInstalledApps(ApplyEngineTestCase):
+    """已安装游戏索引：apply-all 只处理已安装且有配置的游戏"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = write_localconfig(self.steam_dir, "1001", {})
+        self.library_dir = os.path.join(self.temp_dir, "Library")
+        self.steamapps = os.path.join(self.steam_dir, "steamapps")
+        os.makedirs(self.steamapps)
+        os.makedirs(os.path.join(self.library_dir, "steamapps"))
+        folders = {
+            "libraryfolders": {
+                "0": {"path": self.steam_dir, "apps": {}},
+                "1": {"path": self.library_dir, "apps": {}},
+            }
+        }
+        with open(os.path.join(self.steamapps, "libraryfolders.vdf"), "w") as f:
+            vdf.dump(folders, f, pretty=True)
+        self.install("440")
+        self.install("730", library=self.library_dir)
+        self.install("10")  # 没有配置的游戏
+
+    def install(self, app_id, library=None):
+        steamapps = os.path.join(library or self.steam_dir, "steamapps")
+        manifest = {"AppState": {"appid": app_id, "name": f"App {app_id}"}}
+        with open(os.path.join(steamapps, f"appmanifest_{app_id}.acf"), "w") as f:
+            vdf.dump(manifest, f, pretty=True)
+
+    def apply_all(self, **kwargs):
+        manager = self.create_manager(workers=1, offline=True, **kwargs)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            manager.apply_all_configs()
+        return output.getvalue()
+
+    def test_index_covers_all_libraries(self):
+        index = steam_launch_manager.load_installed_apps([Path(self.steam_dir)])
+        self.assertEqual(index.apps, {"10", "440", "730"})
+        self.assertEqual(len(index.libraries), 2)
+
+        # 旧格式的 libraryfolders.vdf 直接给出路径
+        old_format = {"LibraryFolders": {"TimeNextStatsReport": "0", "1": "/games"}}
+        path = os.path.join(self.temp_dir, "libraryfolders.vdf")
+        with open(path, "w") as f:
+            vdf.dump(old_format, f)
+        self.assertEqual(steam_launch_manager.read_library_folders(path), ["/games"])
+
+    def test_index_is_cached_by_directory_mtime(self):
+        steam_dirs = [Path(self.steam_dir)]
+        with mock.patch.object(steam_launch_manager, "GAME_DB_CACHE_RACY_SECONDS", 0):
+            steam_launch_manager.load_installed_apps(steam_dirs)
+            with mock.patch.object(
+                steam_launch_manager,
+                "read_library_folders",
+                side_effect=AssertionError("cache not used"),
+            ), mock.patch.object(
+                steam_launch_manager,
+                "scan_installed_apps",
+                wraps=steam_launch_manager.scan_installed_apps,
+            ) as scan:
+                self.assertIn(
+                    "730", steam_launch_manager.load_installed_apps(steam_dirs).apps
+                )
+                self.assertEqual(scan.call_count, 0)
+
+                # 安装游戏后只重新扫描变化的游戏库
+                self.install("570")
+                os.utime(self.steamapps, ns=(time.time_ns(), time.time_ns() + 10**9))
+                index = steam_launch_manager.load_installed_apps(steam_dirs)
+                self.assertIn("570", index.apps)
+                self.assertEqual(scan.call_count, 1)
+
+    def test_apply_all_only_touches_installed_games(self):
+        output = self.apply_all()
+        self.assertIn("2 installed games (3 known)", output)
+        self.assertEqual(set(read_launch_options(self.path)), {"440", "730"})
+
+        self.apply_all(all_known=True)
+        self.assertEqual(set(read_launch_options(self.path)), {"440", "570", "730"})
+
+    def test_without_steamapps_all_known_games_are_applied(self):
+        shutil.rmtree(self.steamapps)
+        self.apply_all()
+        self.assertEqual(set(read_launch_options(self.path)), {"440", "570", "730"})
+
+    def test_needs_apply_detects_installed_games(self):
+        self.apply_all()
+        needs_apply = steam_launch_manager.needs_apply
+        self.assertIsNone(needs_apply(self.config_dir))
+        self.assertEqual(
+            needs_apply(self.config_dir, all_known=True), "different game selection"
+        )
+
+        # 卸载游戏或安装没有配置的游戏不需要重新应用
+        os.remove(os.path.join(self.steamapps, "appmanifest_440.acf"))
+        self.install("20")
+        self.assertIsNone(needs_apply(self.config_dir))
+
+        self.install("570")
+        self.assertEqual(
+            needs_apply(self.config_dir), "configured games were installed"
+        )
+
+    def test_needs_apply_does_not_parse_library_folders(self):
+        self.apply_all()
+        # Steam 经常重写 libraryfolders.vdf，needs-apply 仍然不能导入 vdf
+        with open(os.path.join(self.steamapps, "libraryfolders.vdf"), "a") as f:
+            f.write("\n")
+        self.install("570", library=self.library_dir)
+        code = (
+            "import sys; module = type(sys)('slm'); "
+            "exec(open(sys.argv[1]).read(), module.__dict__); "
+            "module.DEFAULT_CACHE_PATH = sys.argv[2]; "
+            "print(module.needs_apply(sys.argv[3])); print('vdf' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code, str(script_path), self.cache_dir]
+            + [self.config_dir],
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(
+            result.stdout.splitlines(), ["configured games were installed", "False"]
+        )
+
+    def test_watch_applies_newly_installed_games(self):
+        manager = self.create_manager(workers=1, offline=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.apply_all_configs()
+        state = manager.new_watch_state()
+        self.assertIn(Path(self.steamapps), manager._watch_paths()[2])
+
+        self.install("570")
+        with contextlib.redirect_stdout(io.StringIO()):
+            changed = manager.handle_watch_changes({Path(self.steamapps)}, state)
+        self.assertEqual(changed, {"570"})
+        self.assertEqual(read_launch_options(self.path)["570"], "%command% -novid")
+
+
+class TestSteamProcessDetection(ApplyEngineTestCase):
+    """基于 /proc 的 Steam 进程检测"""
+
+    def make_process(self, proc_dir, pid, comm, exe=None, argv0=None, cwd=None):
+        process_dir = Path(proc_dir) / str(pid)
+        process_dir.mkdir(parents=True)
+        (process_dir / "comm").write_bytes(comm + b"\n")
+        if exe:
+            os.symlink(exe, process_dir / "exe")
+        if argv0:
+            (process_dir / "cmdline").write_bytes(argv0.encode() + b"\0-silent\0")
+        if cwd:
+            os.symlink(cwd, process_dir / "cwd")
+
+    def test_find_steam_processes_and_roots(self):
+        proc_dir = os.path.join(self.temp_dir, "proc")
+        self.make_process(proc_dir, 100, b"steam", exe="/a/Steam/ubuntu12_32/steam")
+        self.make_process(
+            proc_dir, 101, b"steam", argv0="ubuntu12_64/steam", cwd="/b/Steam"
+        )
+        self.make_process(proc_dir, 102, b"steam", argv0="/usr/bin/steam")
+        self.make_process(proc_dir, 103, b"steamwebhelper", exe="/a/Steam/x")
+        os.makedirs(os.path.join(proc_dir, "self"))
+
+        processes = sorted(steam_launch_manager.find_steam_processes(proc_dir))
+        SteamProcess = steam_launch_manager.SteamProcess
+        self.assertEqual(
+            processes,
+            [
+                SteamProcess(100, Path("/a/Steam")),
+                SteamProcess(101, Path("/b/Steam")),
+                SteamProcess(102, None),
+            ],
+        )
+
+    def test_only_processes_of_managed_roots_count(self):
+        SteamProcess = steam_launch_manager.SteamProcess
+        other_root = SteamProcess(100, Path(self.temp_dir) / "OtherSteam")
+        own_root = SteamProcess(101, Path(self.steam_dir))
+        manager = self.create_manager()
+
+        with mock.patch.object(
+            steam_launch_manager, "find_steam_processes", return_value=[other_root]
+        ):
+            self.assertFalse(manager.is_steam_running())
+        with mock.patch.object(
+            steam_launch_manager,
+            "find_steam_processes",
+            return_value=[other_root, own_root],
+        ):
+            self.assertEqual(manager.steam_processes(), [own_root])
+
+    def test_wait_for_process_exit(self):
+        import subprocess
+        import threading
+
+        process = subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(0.3)"]
+        )
+        threading.Thread(target=process.wait, daemon=True).start()
+        wait = steam_launch_manager.wait_for_process_exit
+        self.assertFalse(wait(process.pid, timeout=0.05))
+        self.assertTrue(wait(process.pid, timeout=10))
+
+    def test_wait_without_pidfd(self):
+        import subprocess
+        import threading
+
+        process = subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(0.2)"]
+        )
+        threading.Thread(target=process.wait, daemon=True).start()
+        with mock.patch.object(
+            steam_launch_manager.os, "pidfd_open", side_effect=OSError, create=True
+        ), mock.patch.object(steam_launch_manager, "STEAM_EXIT_POLL_SECONDS", 0.05):
+            self.assertTrue(
+                steam_launch_manager.wait_for_process_exit(process.pid, timeout=10)
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+性能基准脚本冒烟测试
+使用极小规模运行一遍，确保基准脚本与当前代码保持同步
+"""
+
+import contextlib
+import io
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+
+import bench  # noqa: E402
+
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.baseline = Path(self.temp_dir) / "baseline.json"
+        self.args = [
+            "--apps",
+            "20",
+            "--users",
+            "2",
+            "--games",
+            "10",
+            "--repeat",
+            "1",
+            "--baseline",
+            str(self.baseline),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_bench(self, *extra):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            exit_code = bench.main(self.args + list(extra))
+        return exit_code, output.getvalue()
+
+    def test_save_and_compare_baseline(self):
+        exit_code, _ = self.run_bench("--save-baseline")
+        self.assertEqual(exit_code, 0)
+        results = json.loads(self.baseline.read_text())["results"]
+        self.assertIn("apply_all_warm", results)
+        self.assertIn("vdf_parse_binary", results)
+
+        # 基线被人为调快后应报告回归
+        for result in results.values():
+            result["min"] /= 1000
+        baseline = json.loads(self.baseline.read_text())
+        baseline["results"] = results
+        self.baseline.write_text(json.dumps(baseline))
+
+        exit_code, output = self.run_bench()
+        self.assertEqual(exit_code, 1)
+        self.assertIn("REGRESSION", output)
+
+    def test_different_parameters_are_not_compared(self):
+        self.run_bench("--save-baseline")
+        exit_code, output = self.run_bench("--format", "text")
+        self.assertEqual(exit_code, 0)
+        self.assertIn("different parameters", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,7 @@ import shutil
 import subprocess
 import tempfile
 import unittest
+import zipfile
 from pathlib import Path
 
 import yaml
@@ -216,6 +217,75 @@ class TestSteamLaunchManagerCLI(unittest.TestCase):
             # 网络问题时跳过测试
             self.skipTest("Network connection required for update-db test")
 
+    def test_needs_apply_command(self):
+        """测试needs-apply快速检查：退出码0表示需要应用，且不导入yaml/vdf"""
+        env = dict(os.environ, HOME=self.temp_dir, PYTHONPROFILEIMPORTTIME="1")
+        cmd = ["python3", str(self.script_path), "--config", self.config_dir]
+
+        result = subprocess.run(
+            cmd + ["needs-apply"], capture_output=True, text=True, env=env
+        )
+        self.assertEqual(result.returncode, 0)
+        imported = [line.split("|")[-1].strip() for line in result.stderr.splitlines()]
+        self.assertNotIn("yaml", imported)
+        self.assertNotIn("vdf", imported)
+
+        subprocess.run(
+            cmd + ["apply-all", "--offline"], capture_output=True, text=True, env=env
+        )
+        result = subprocess.run(
+            cmd + ["needs-apply"], capture_output=True, text=True, env=env
+        )
+        self.assertEqual(result.returncode, 1, result.stderr)
+
+    def test_import_has_no_side_effects(self):
+        """测试作为模块加载时不配置日志、不创建日志文件，也不导入argparse"""
+        code = (
+            "import sys; path = sys.argv[1]; "
+            "exec(compile(open(path).read(), path, 'exec'), {'__name__': 'slm'}); "
+            "import logging; print(len(logging.getLogger().handlers)); "
+            "print('argparse' in sys.modules)"
+        )
+        env = dict(os.environ, HOME=self.temp_dir)
+        result = subprocess.run(
+            ["python3", "-c", code, str(self.script_path)],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ["0", "False"])
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, ".cache")))
+
+    def test_zipapp_build(self):
+        """测试zipapp打包：包含预编译字节码，命令行为与脚本一致"""
+        output = os.path.join(self.temp_dir, "steam-launch-manager.pyz")
+        build_script = Path(__file__).parent.parent / "tools" / "build-zipapp.py"
+        result = subprocess.run(
+            ["python3", str(build_script), "-o", output], capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with zipfile.ZipFile(output) as archive:
+            self.assertIn("steam_launch_manager.pyc", archive.namelist())
+
+        env = dict(os.environ, HOME=self.temp_dir)
+        cmd = ["python3", output, "--config", self.config_dir]
+        result = subprocess.run(cmd + ["--help"], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("needs-apply", result.stdout)
+
+        result = subprocess.run(
+            cmd + ["needs-apply"], capture_output=True, text=True, env=env
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        subprocess.run(
+            cmd + ["apply-all", "--offline"], capture_output=True, text=True, env=env
+        )
+        result = subprocess.run(
+            cmd + ["needs-apply"], capture_output=True, text=True, env=env
+        )
+        self.assertEqual(result.returncode, 1, result.stderr)
+
 
 class TestSteamConfigGenCLI(unittest.TestCase):
     """测试steam-config-gen命令行工具"""
@@ -308,6 +378,49 @@ class TestSteamWrapperCLI(unittest.TestCase):
         # 不要求特定的返回码，只要不崩溃即可
         self.assertIsNotNone(result)
 
+    def run_wrapper(self, needs_apply_status):
+        """用假的管理器和 steam 运行包装器，返回输出"""
+        bin_dir = os.path.join(self.temp_dir, "bin")
+        os.makedirs(bin_dir, exist_ok=True)
+        manager = os.path.join(bin_dir, "steam-launch-manager")
+        with open(manager, "w") as f:
+            f.write(
+                "#!/bin/bash\n"
+                '[ "$1" = needs-apply ] && exit "$NEEDS_APPLY_STATUS"\n'
+                'echo "ran $1"\n'
+            )
+        with open(os.path.join(bin_dir, "steam"), "w") as f:
+            f.write('#!/bin/bash\necho "steam started"\n')
+        for name in ("steam-launch-manager", "steam"):
+            os.chmod(os.path.join(bin_dir, name), 0o755)
+
+        wrapper = os.path.join(bin_dir, "steam-wrapper")
+        with open(wrapper, "w") as f:
+            f.write(
+                self.script_path.read_text().replace(
+                    "/usr/bin/steam-launch-manager", manager
+                )
+            )
+        env = dict(
+            os.environ,
+            PATH=f"{bin_dir}:{os.environ.get('PATH', '')}",
+            NEEDS_APPLY_STATUS=str(needs_apply_status),
+        )
+        result = subprocess.run(
+            ["bash", wrapper], capture_output=True, text=True, env=env, timeout=5
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("steam started", result.stdout)
+        return result.stdout
+
+    def test_wrapper_needs_apply_status(self):
+        """测试包装器按needs-apply退出码决定是否应用，未知退出码按需要应用处理"""
+        self.assertIn("ran apply-all", self.run_wrapper(0))
+        self.assertNotIn("ran apply-all", self.run_wrapper(1))
+        self.assertNotIn("ran apply-all", self.run_wrapper(3))
+        # argparse 用法错误（例如旧版本没有 needs-apply）的退出码
+        self.assertIn("ran apply-all", self.run_wrapper(2))
+
 
 class TestEndToEndWorkflow(unittest.TestCase):
     """端到端工作流程测试"""
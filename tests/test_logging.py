@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+日志系统测试
+验证后台写入、按大小轮转、级别过滤以及 fork 子进程的日志
+"""
+
+import contextlib
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# 动态导入 steam-launch-manager 脚本
+script_path = Path(__file__).parent.parent / "src" / "bin" / "steam-launch-manager"
+
+with open(script_path, "r") as f:
+    script_content = f.read()
+
+steam_launch_manager = type(sys)("steam_launch_manager_logging")
+exec(script_content, steam_launch_manager.__dict__)
+
+
+class CountingMessage:
+    """记录被格式化次数的日志参数"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "counted"
+
+
+class TestLoggingPipeline(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(
+            self.temp_dir, ".cache", "steam-launch-manager", "steam-launch-manager.log"
+        )
+        root = logging.getLogger()
+        self._original_handlers = root.handlers[:]
+        self._original_level = root.level
+        self.stderr = io.StringIO()
+
+        patcher = mock.patch.dict(os.environ, {"HOME": self.temp_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        steam_launch_manager.shutdown_logging()
+        root = logging.getLogger()
+        root.handlers = self._original_handlers
+        root.setLevel(self._original_level)
+        shutil.rmtree(self.temp_dir)
+
+    def setup_logging(self, **kwargs):
+        with contextlib.redirect_stderr(self.stderr):
+            return steam_launch_manager.setup_logging(**kwargs)
+
+    def read_log(self):
+        steam_launch_manager.shutdown_logging()
+        with open(self.log_file, encoding="utf-8") as f:
+            return f.read()
+
+    def test_file_is_written_in_background(self):
+        logger = self.setup_logging()
+        # 根 logger 上只有队列和控制台处理器，文件由后台线程写入
+        handler_types = {type(handler) for handler in logging.getLogger().handlers}
+        self.assertIn(logging.handlers.QueueHandler, handler_types)
+        self.assertNotIn(logging.handlers.RotatingFileHandler, handler_types)
+
+        logger.info("applied %d games", 3)
+        self.assertIn("applied 3 games", self.read_log())
+
+    def test_filtered_debug_records_are_not_formatted(self):
+        logger = self.setup_logging()
+        message = CountingMessage()
+        logger.debug("value: %s", message)
+        self.assertFalse(logger.isEnabledFor(logging.DEBUG))
+        self.assertEqual(message.formatted, 0)
+        # 没有需要写入的记录时不会创建日志文件
+        steam_launch_manager.shutdown_logging()
+        self.assertFalse(os.path.exists(self.log_file))
+
+    def test_verbose_writes_debug_to_file(self):
+        logger = self.setup_logging(verbose=True)
+        logger.debug("value: %s", CountingMessage())
+        self.assertIn("value: counted", self.read_log())
+
+    def test_log_file_is_rotated_by_size(self):
+        with mock.patch.object(steam_launch_manager, "LOG_FILE_MAX_BYTES", 1000):
+            logger = self.setup_logging()
+            for index in range(100):
+                logger.info("line %d", index)
+            last = self.read_log()
+
+        self.assertIn("line 99", last)
+        self.assertLessEqual(os.path.getsize(self.log_file), 1000)
+        self.assertTrue(os.path.exists(self.log_file + ".1"))
+        self.assertFalse(
+            os.path.exists(
+                f"{self.log_file}.{steam_launch_manager.LOG_FILE_BACKUP_COUNT + 1}"
+            )
+        )
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_forked_child_writes_directly(self):
+        logger = self.setup_logging()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                logger.info("from child")
+            finally:
+                # 与进程池子进程一样不执行 atexit
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertIn("from child", self.read_log())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+社区数据库网络功能测试
+使用本地 HTTP 服务器代替真实镜像，不依赖外部网络
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+# 动态导入 steam-launch-manager 脚本
+script_path = Path(__file__).parent.parent / "src" / "bin" / "steam-launch-manager"
+
+with open(script_path, "r") as f:
+    script_content = f.read()
+
+steam_launch_manager = type(sys)("steam_launch_manager_network")
+exec(script_content, steam_launch_manager.__dict__)
+
+SteamLaunchManager = steam_launch_manager.SteamLaunchManager
+
+
+def forbid_sockets():
+    """任何网络连接尝试都会让测试失败"""
+
+    def fail(*args, **kwargs):
+        raise AssertionError("unexpected network access")
+
+    return mock.patch.multiple(socket, create_connection=fail, getaddrinfo=fail)
+
+
+class MirrorServer:
+    """本地 HTTP 镜像：按路径返回固定内容，可模拟延迟、错误状态和 ETag"""
+
+    def __init__(self, routes, delay=0, status=200, etag=None):
+        self.routes = routes
+        self.delay = delay
+        self.status = status
+        self.etag = etag
+        self.requests = []
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                mirror.requests.append(dict(self.headers))
+                time.sleep(mirror.delay)
+                body = mirror.routes.get(self.path)
+                status = mirror.status if body is not None else 404
+                if mirror.etag and self.headers.get("If-None-Match") == mirror.etag:
+                    status, body = 304, None
+                self.send_response(status)
+                if mirror.etag:
+                    self.send_header("ETag", mirror.etag)
+                self.end_headers()
+                if body is not None:
+                    self.wfile.write(body.encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class NetworkTestCase(unittest.TestCase):
+    """带临时配置目录的测试基类"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_dir = os.path.join(self.temp_dir, "steam-launch-manager")
+        os.makedirs(os.path.join(self.config_dir, "custom"))
+        os.makedirs(os.path.join(self.config_dir, "community"))
+
+        with open(os.path.join(self.config_dir, "custom", "games.yaml"), "w") as f:
+            yaml.dump({"global": {"auto_update_community_db": True}, "games": {}}, f)
+
+        self._original_cache_path = steam_launch_manager.DEFAULT_CACHE_PATH
+        steam_launch_manager.DEFAULT_CACHE_PATH = os.path.join(self.temp_dir, "cache")
+
+    def tearDown(self):
+        steam_launch_manager.DEFAULT_CACHE_PATH = self._original_cache_path
+        shutil.rmtree(self.temp_dir)
+
+
+class TestOfflineMode(NetworkTestCase):
+    """构造管理器不访问网络，离线模式下完全不打开连接"""
+
+    def test_constructor_does_no_network_io(self):
+        with forbid_sockets():
+            SteamLaunchManager(config_path=self.config_dir)
+
+    def test_offline_mode_opens_no_sockets(self):
+        with forbid_sockets():
+            manager = SteamLaunchManager(config_path=self.config_dir, offline=True)
+            manager.check_updates_within_budget()
+            manager.force_update_community_db()
+            self.assertFalse(manager._download_with_retry())
+
+    def test_no_network_counts_as_checked(self):
+        community_dir = os.path.join(self.config_dir, "community")
+        with open(os.path.join(community_dir, "games.yaml"), "w") as f:
+            f.write("games: {}\n")
+        version_path = os.path.join(community_dir, "version.txt")
+        with open(version_path, "w") as f:
+            f.write("Version: 1\n")
+        os.utime(version_path, (0, 0))
+
+        manager = SteamLaunchManager(config_path=self.config_dir)
+        with mock.patch.object(manager, "_quick_network_check", return_value=False):
+            manager.check_community_updates()
+        self.assertFalse(manager._should_update_database())
+
+    def test_offline_environment_variable(self):
+        with mock.patch.dict(os.environ, {steam_launch_manager.OFFLINE_ENV_VAR: "1"}):
+            manager = SteamLaunchManager(config_path=self.config_dir)
+        self.assertTrue(manager.offline)
+
+
+class TestMirrorRace(NetworkTestCase):
+    """所有镜像同时请求，取最先返回的有效结果"""
+
+    def start_mirror(self, routes, **kwargs):
+        mirror = MirrorServer(routes, **kwargs)
+        self.addCleanup(mirror.close)
+        return mirror
+
+    def create_manager(self, mirrors):
+        manager = SteamLaunchManager(config_path=self.config_dir)
+        manager.version_urls = [mirror.url("/VERSION") for mirror in mirrors]
+        manager.db_urls = [mirror.url("/games-db.yaml") for mirror in mirrors]
+        return manager
+
+    def test_fastest_mirror_wins(self):
+        slow = self.start_mirror({"/VERSION": "1.0"}, delay=2)
+        fast = self.start_mirror({"/VERSION": "2.0"})
+        manager = self.create_manager([slow, fast])
+
+        start = time.monotonic()
+        self.assertEqual(manager._get_remote_version(), "2.0")
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_invalid_and_failing_mirrors_are_skipped(self):
+        broken = self.start_mirror({"/games-db.yaml": "games: {}"}, status=500)
+        invalid = self.start_mirror({"/games-db.yaml": "games: [unclosed"})
+        valid = self.start_mirror({"/games-db.yaml": "games:\n  '440': {}\n"})
+        manager = self.create_manager([broken, invalid, valid])
+
+        success, url, content = manager._download_database_with_timeout(3)
+        self.assertTrue(success)
+        self.assertEqual(url, valid.url("/games-db.yaml"))
+        self.assertIn("440", content)
+
+    def test_all_mirrors_failing(self):
+        broken = self.start_mirror({}, status=500)
+        manager = self.create_manager([broken])
+        self.assertIsNone(manager._get_remote_version_quick())
+        self.assertEqual(manager._download_database(), (False, None, None))
+
+    def test_fastest_mirror_is_tried_first_next_time(self):
+        slow = self.start_mirror({"/VERSION": "slow"}, delay=0.5)
+        fast = self.start_mirror({"/VERSION": "fast"})
+        self.create_manager([slow, fast])._get_remote_version()
+
+        # 两个镜像都变快后，上次最快的镜像先发出请求
+        slow.delay = 0
+        manager = self.create_manager([slow, fast])
+        self.assertEqual(manager._get_remote_version(), "fast")
+
+
+class TestDeltaUpdates(NetworkTestCase):
+    """条件请求和增量补丁"""
+
+    old_db = "games:\n  '440':\n    name: TF2\n  '570':\n    name: Dota 2\n"
+    new_db = "games:\n  '440':\n    name: Team Fortress 2\n  '730':\n    name: CS2\n"
+
+    def setUp(self):
+        super().setUp()
+        self.db_path = os.path.join(self.config_dir, "community", "games.yaml")
+
+    def create_manager(self, mirror):
+        manager = SteamLaunchManager(config_path=self.config_dir)
+        manager.version_urls = [mirror.url("/VERSION")]
+        manager.db_urls = [mirror.url("/games-db.yaml")]
+        return manager
+
+    def test_unchanged_database_is_not_downloaded_again(self):
+        mirror = MirrorServer(
+            {"/VERSION": "2", "/games-db.yaml": self.new_db}, etag='"v2"'
+        )
+        self.addCleanup(mirror.close)
+        manager = self.create_manager(mirror)
+
+        self.assertTrue(manager._download_with_retry())
+        self.assertNotIn("If-None-Match", mirror.requests[-1])
+
+        self.assertTrue(manager._download_with_retry())
+        self.assertEqual(mirror.requests[-1].get("If-None-Match"), '"v2"')
+        self.assertEqual(manager._get_local_version(), "2")
+        with open(self.db_path) as f:
+            self.assertEqual(f.read(), self.new_db)
+
+    def test_modified_local_database_sends_no_validators(self):
+        mirror = MirrorServer(
+            {"/VERSION": "2", "/games-db.yaml": self.new_db}, etag='"v2"'
+        )
+        self.addCleanup(mirror.close)
+        manager = self.create_manager(mirror)
+        manager._download_with_retry()
+
+        with open(self.db_path, "w") as f:
+            f.write(self.old_db)
+        self.assertTrue(manager._download_with_retry())
+        self.assertNotIn("If-None-Match", mirror.requests[-1])
+        with open(self.db_path) as f:
+            self.assertEqual(f.read(), self.new_db)
+
+    def test_patch_is_applied_instead_of_full_download(self):
+        patch = steam_launch_manager.build_db_patch(
+            yaml.safe_load(self.old_db), yaml.safe_load(self.new_db), "1", "2"
+        )
+        mirror = MirrorServer(
+            {
+                "/VERSION": "2",
+                "/patches/1.yaml": yaml.safe_dump(patch),
+                # 完整数据库不应被请求
+                "/games-db.yaml": "games: [unclosed",
+            }
+        )
+        self.addCleanup(mirror.close)
+        with open(self.db_path, "w") as f:
+            f.write(self.old_db)
+        manager = self.create_manager(mirror)
+        manager._update_version_info("test", "1")
+
+        self.assertTrue(manager._download_with_retry())
+        with open(self.db_path) as f:
+            self.assertEqual(yaml.safe_load(f), yaml.safe_load(self.new_db))
+        self.assertEqual(manager._get_local_version(), "2")
+
+    def check_updates(self, mirror):
+        """检查更新到期时运行一次带预算的更新检查，返回使用的管理器"""
+        manager = self.create_manager(mirror)
+        with mock.patch.object(manager, "_quick_network_check", return_value=True):
+            manager.check_updates_within_budget(budget=5)
+        return manager
+
+    def test_found_update_is_applied_within_budget(self):
+        with open(self.db_path, "w") as f:
+            f.write(self.old_db)
+        mirror = MirrorServer({"/VERSION": "2", "/games-db.yaml": self.new_db})
+        self.addCleanup(mirror.close)
+        manager = self.create_manager(mirror)
+        manager._update_version_info("test", "1")
+        os.utime(manager.community_version_path, (0, 0))
+
+        manager = self.check_updates(mirror)
+        self.assertEqual(manager._get_local_version(), "2")
+        self.assertIn("730", manager.community_config["games"])
+        with open(self.db_path) as f:
+            self.assertEqual(f.read(), self.new_db)
+
+    def test_failed_download_is_not_probed_again(self):
+        with open(self.db_path, "w") as f:
+            f.write(self.old_db)
+        mirror = MirrorServer({"/VERSION": "2"})
+        self.addCleanup(mirror.close)
+        manager = self.create_manager(mirror)
+        manager._update_version_info("test", "1")
+        os.utime(manager.community_version_path, (0, 0))
+
+        with mock.patch.object(steam_launch_manager, "RETRY_ATTEMPTS", 1):
+            self.check_updates(mirror)
+        self.assertEqual(manager._get_local_version(), "1")
+        requests = len(mirror.requests)
+        self.assertGreater(requests, 0)
+
+        # 下载失败也记为已检查，间隔内的下一次运行不再访问镜像
+        self.check_updates(mirror)
+        self.assertEqual(len(mirror.requests), requests)
+
+    def test_patch_round_trip(self):
+        old = {"global": {"a": 1}, "games": {"1": {"x": 1}, "2": {"y": 2}}}
+        new = {"global": {"a": 2}, "games": {"1": {"x": 1}, "3": {"z": 3}}}
+        patch = steam_launch_manager.build_db_patch(old, new, "1", "2")
+
+        self.assertEqual(patch["games"]["set"], {"3": {"z": 3}})
+        self.assertEqual(patch["games"]["remove"], ["2"])
+        self.assertEqual(steam_launch_manager.apply_db_patch(old, patch), new)
+
+
+if __name__ == "__main__":
+    unittest.main()
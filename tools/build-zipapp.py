@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+把 steam-launch-manager 打包成单文件 zipapp
+
+归档内附带预编译的字节码（unchecked-hash 模式，运行时不再检查源码），
+每次启动省去编译整个脚本的时间。用法：
+
+    python tools/build-zipapp.py [-o build/steam-launch-manager]
+"""
+
+import argparse
+import importlib.util
+import os
+import py_compile
+import shutil
+import sys
+import tempfile
+import zipapp
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SCRIPT_PATH = REPO_ROOT / "src" / "bin" / "steam-launch-manager"
+MODULE_NAME = "steam_launch_manager"
+
+MAIN_SOURCE = f"""\
+import sys
+
+from {MODULE_NAME} import main
+
+sys.exit(main())
+"""
+
+
+def build(output, script=SCRIPT_PATH, interpreter="/usr/bin/env python3"):
+    """生成 zipapp，返回输出路径"""
+    output = Path(output)
+    with tempfile.TemporaryDirectory() as staging:
+        staging = Path(staging)
+        source = staging / f"{MODULE_NAME}.py"
+        shutil.copyfile(script, source)
+        (staging / "__main__.py").write_text(MAIN_SOURCE)
+
+        # zipimport 只会直接加载与源码同目录的 .pyc，不读 __pycache__
+        for path in (source, staging / "__main__.py"):
+            py_compile.compile(
+                str(path),
+                cfile=str(path.with_suffix(".pyc")),
+                doraise=True,
+                invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+            )
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        zipapp.create_archive(staging, output, interpreter=interpreter)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=str(REPO_ROOT / "build" / "steam-launch-manager"),
+        help="output path (default: build/steam-launch-manager)",
+    )
+    parser.add_argument(
+        "--python",
+        default="/usr/bin/env python3",
+        help="interpreter for the shebang line",
+    )
+    args = parser.parse_args(argv)
+
+    output = build(args.output, interpreter=args.python)
+    print(
+        f"Built {output} ({os.path.getsize(output)} bytes, "
+        f"bytecode for {sys.implementation.cache_tag}, magic "
+        f"{importlib.util.MAGIC_NUMBER.hex()})"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())